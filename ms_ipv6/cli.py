@@ -4,34 +4,21 @@ Command Line Interface for ModelScope IPV6 Download Assistant
 """
 
 import argparse
-
-from loguru import logger
+import sys
+from typing import Callable, Dict, Optional, Sequence
 
 from . import __version__
-from .downloader import ModelScopeDownloader
-from .utils import setup_logging
-
-
-def create_parser() -> argparse.ArgumentParser:
-    """创建命令行参数解析器，允许全局参数置于子命令之前或之后。"""
-    # 公共父解析器：仅包含通用日志选项
-    common = argparse.ArgumentParser(add_help=False)
-    common.add_argument("--verbose", "-v", action="store_true", help="启用详细日志输出")
-
-    # 主解析器不再包含公共参数，禁止在子命令前书写全局选项
-    parser = argparse.ArgumentParser(
-        description="ModelScope IPV6 下载助手",
-        prog="ms-ipv6",
-    )
 
-    parser.add_argument("--version", action="version", version=f"ms-ipv6 {__version__}")
+# 子命令及其帮助文本；参数定义由 _SUBCOMMAND_BUILDERS 按需构建
+_SUBCOMMANDS: Dict[str, str] = {
+    "plan": "生成下载计划 _msv6.json",
+    "download": "根据下载计划执行下载",
+    "version": "显示 ms-ipv6 版本",
+}
 
-    subparsers = parser.add_subparsers(dest="command", required=True)
 
-    # 子命令：plan（生成下载计划）——不支持配置 IPv6
-    plan_parser = subparsers.add_parser(
-        "plan", parents=[common], help="生成下载计划 _msv6.json"
-    )
+def _build_plan(plan_parser: argparse.ArgumentParser) -> None:
+    """子命令：plan（生成下载计划）——不支持配置 IPv6"""
     # 严格新规则：显式类型 + 仓库ID
     plan_parser.add_argument(
         "repo_type",
@@ -60,11 +47,15 @@ def create_parser() -> argparse.ArgumentParser:
         help="忽略下载的通配模式，可多次使用，例如 --ignore-pattern '*.tmp'",
     )
 
-    # 子命令：download（根据计划下载）——支持 IPv6
-    dl_parser = subparsers.add_parser(
-        "download", parents=[common], help="根据下载计划执行下载"
-    )
+
+def _build_download(dl_parser: argparse.ArgumentParser) -> None:
+    """子命令：download（根据计划下载）——支持 IPv6"""
     dl_parser.add_argument("--ipv6", action="store_true", help="强制使用IPV6")
+    dl_parser.add_argument(
+        "--prefer-ipv6",
+        action="store_true",
+        help="优先使用IPv6，不通时快速回退IPv4（Happy Eyeballs）；与 --ipv6 同用时以 --ipv6 为准",
+    )
     dl_parser.add_argument("plan_file", help="计划文件路径（_msv6.json）")
     dl_parser.add_argument(
         "--local-dir", required=True, help="文件保存的本地根目录（必填）"
@@ -89,31 +80,120 @@ def create_parser() -> argparse.ArgumentParser:
     dl_parser.add_argument(
         "--timeout", type=int, default=60, help="HTTP 超时秒数，默认 60"
     )
+    dl_parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="使用协程并发下载（并发数为 workers*4），适合大量小文件；"
+        "不支持 --prefer-ipv6，-v 下不输出逐连接日志",
+    )
+
+
+_SUBCOMMAND_BUILDERS: Dict[str, Callable[[argparse.ArgumentParser], None]] = {
+    "plan": _build_plan,
+    "download": _build_download,
+}
+
+
+def _peek_command(argv: Sequence[str]) -> Optional[str]:
+    """在完整解析前取出子命令名（全局选项只能写在子命令之后）。"""
+    for arg in argv:
+        if not arg.startswith("-"):
+            return arg
+    return None
+
 
-    # 子命令：version（显示版本信息）
-    subparsers.add_parser("version", help="显示 ms-ipv6 版本")
+def create_parser(argv: Optional[Sequence[str]] = None) -> argparse.ArgumentParser:
+    """创建命令行参数解析器，允许全局参数置于子命令之前或之后。
+
+    仅为 argv 中出现的子命令构建完整参数；未给出（或无法识别）子命令时，
+    只注册各子命令的名称与帮助文本，用于 ``--help`` 列表与错误提示。
+
+    Args:
+        argv: 待解析的参数列表，默认取 ``sys.argv[1:]``
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    command = _peek_command(argv)
+
+    # 公共父解析器：仅包含通用日志选项
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--verbose", "-v", action="store_true", help="启用详细日志输出")
+
+    # 主解析器不再包含公共参数，禁止在子命令前书写全局选项
+    parser = argparse.ArgumentParser(
+        description="ModelScope IPV6 下载助手",
+        prog="ms-ipv6",
+    )
+
+    parser.add_argument(
+        "--version", "-V", action="version", version=f"ms-ipv6 {__version__}"
+    )
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    if command in _SUBCOMMANDS:
+        names = [command]
+    else:
+        names = list(_SUBCOMMANDS)
+    for name in names:
+        builder = _SUBCOMMAND_BUILDERS.get(name)
+        if builder is None or name != command:
+            subparsers.add_parser(name, help=_SUBCOMMANDS[name])
+            continue
+        builder(subparsers.add_parser(name, parents=[common], help=_SUBCOMMANDS[name]))
 
     return parser
 
 
 def main() -> None:
     """主入口点"""
-    parser = create_parser()
-    args = parser.parse_args()
+    argv = sys.argv[1:]
+    # 仅查询版本时无需构建解析器
+    if len(argv) == 1 and argv[0] in ("--version", "-V"):
+        print(f"ms-ipv6 {__version__}")
+        return
+
+    parser = create_parser(argv)
+    args = parser.parse_args(argv)
+    if (
+        args.command == "download"
+        and args.use_async
+        and args.prefer_ipv6
+        and not args.ipv6
+    ):
+        parser.error("--async 不支持 --prefer-ipv6（Happy Eyeballs 仅用于线程下载）")
+
+    # 重量级依赖（loguru、httpx 等）在参数解析完成后再导入，
+    # 使 --help/--version 及参数错误路径无需加载网络栈；
+    # 日志配置位于独立模块，version 子命令也不会加载 httpx
+    from loguru import logger
+
+    from .log import setup_logging
 
     # --verbose 控制日志级别（DEBUG）
     enable_debug = bool(getattr(args, "verbose", False))
     # 在 download 子命令下启用 tqdm 兼容的日志 sink，避免覆盖进度条
     setup_logging(enable_debug, use_tqdm=(args.command == "download"))
 
+    if args.command == "download" and args.use_async and enable_debug:
+        logger.warning("--async 模式下不输出逐连接的 DEBUG 日志")
+
     if args.command == "version":
         logger.info(f"ms-ipv6 {__version__}")
         return
 
+    from .downloader import ModelScopeDownloader
+
     use_ipv6 = (
         bool(getattr(args, "ipv6", False)) if args.command == "download" else False
     )
-    downloader = ModelScopeDownloader(use_ipv6=use_ipv6)
+    prefer_ipv6 = (
+        bool(getattr(args, "prefer_ipv6", False))
+        if args.command == "download"
+        else False
+    )
+    downloader = ModelScopeDownloader(use_ipv6=use_ipv6, prefer_ipv6=prefer_ipv6)
 
     if args.command == "plan":
         repo_type = args.repo_type
@@ -128,16 +208,24 @@ def main() -> None:
         )
         logger.info(f"下载计划已生成: {plan_path}")
     elif args.command == "download":
-        summary = downloader.download_from_plan(
-            args.plan_file,
-            local_dir=args.local_dir,
-            workers=args.workers,
-            overwrite=args.overwrite,
-            skip_existing=not args.no_skip_existing,
-            timeout=args.timeout,
-            only_raw=args.only_raw,
-            only_no_raw=args.only_no_raw,
-        )
+        from .utils import close_sessions
+
+        try:
+            summary = downloader.download_from_plan(
+                args.plan_file,
+                local_dir=args.local_dir,
+                workers=args.workers,
+                overwrite=args.overwrite,
+                skip_existing=not args.no_skip_existing,
+                timeout=args.timeout,
+                only_raw=args.only_raw,
+                only_no_raw=args.only_no_raw,
+                use_async=args.use_async,
+            )
+        finally:
+            # 关闭下载器独占及共享的 HTTP 客户端，释放保活连接
+            downloader.close()
+            close_sessions()
         logger.info(
             "下载结果: total={total}, success={success}, skipped={skipped}, failed={failed}".format(
                 **summary
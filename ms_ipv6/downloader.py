@@ -3,11 +3,11 @@ Core functionality for ModelScope downloads
 """
 
 # 标准库
+import asyncio
 import fnmatch
 import hashlib
 import json
 import os
-import socket
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from threading import Lock
@@ -17,25 +17,50 @@ import httpx
 from loguru import logger
 from tqdm import tqdm
 
+from .log import is_debug_enabled
 from .schema import Plan, PlanFile
-from .utils import create_ipv6_session, create_observing_session, get_file_size_human
+from .utils import (
+    SockAddr,
+    astream_to_file,
+    create_async_session,
+    create_ipv6_async_session,
+    create_ipv6_session,
+    create_observing_session,
+    ensure_dir,
+    get_default_cache_dir,
+    get_file_size_human,
+    make_progress,
+    socket_family_name,
+    stream_to_file,
+)
 
 
 class ModelScopeDownloader:
     """ModelScope下载器类"""
 
-    def __init__(self, cache_dir: Optional[str] = None, use_ipv6: bool = False):
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        use_ipv6: bool = False,
+        prefer_ipv6: bool = False,
+    ):
         """
         初始化下载器
 
         Args:
             cache_dir: 缓存目录
             use_ipv6: 是否使用IPV6
+            prefer_ipv6: 未强制 IPv6 时，是否以 Happy Eyeballs 方式优先 IPv6
         """
-        self.cache_dir = cache_dir or os.path.expanduser("~/.cache/ms_ipv6")
+        self.cache_dir = cache_dir or get_default_cache_dir()
         self.use_ipv6 = use_ipv6
+        self.prefer_ipv6 = prefer_ipv6
         # 用于去重相邻的连接日志
         self._last_conn_log: Optional[tuple] = None
+        # 会话连接池按下载并发数调整（由 download_from_plan 设置）
+        self._workers: Optional[int] = None
+        # 带连接回调的客户端为本实例独占，需由 close() 关闭
+        self._owns_session = False
 
         # 确保缓存目录存在
         os.makedirs(self.cache_dir, exist_ok=True)
@@ -51,37 +76,64 @@ class ModelScopeDownloader:
                 return self._real is not None
 
             def ensure(self):
-                if self._real is None:
+                # 客户端被外部关闭（如 close_sessions()）后按需重新构建
+                if self._real is None or self._real.is_closed:
                     self._real = self._factory()
                 return self._real
 
+            def release(self, close: bool) -> None:
+                """丢弃已创建的客户端；close 为 True 时一并关闭"""
+                real, self._real = self._real, None
+                if close and real is not None:
+                    real.close()
+
             def __getattr__(self, name: str):
                 return getattr(self.ensure(), name)
 
         def _log_family(sock, peer):
-            fam = getattr(sock, "family", None)
-            fam_str = {socket.AF_INET: "IPv4", socket.AF_INET6: "IPv6"}.get(
-                fam, str(fam)
-            )
+            family = getattr(sock, "family", None)
+            fam_str = socket_family_name(family)
             key = (fam_str, peer)
             if self._last_conn_log == key:
                 return
             self._last_conn_log = key
-            logger.debug("connection: family={} peer={}", fam_str, peer)
+            # 与连接建立日志、当前连接日志使用同一地址格式
+            if family is not None:
+                peer = SockAddr.from_sockaddr(family, peer)
+            logger.debug("connection: family={} peer={}", fam_str, str(peer))
 
         def _factory():
-            if self.use_ipv6:
-                sess = create_ipv6_session(on_connect=_log_family, record_last=True)
-                logger.info("使用IPv6专用会话进行网络请求")
+            # 连接回调与记录仅服务于 DEBUG 日志；未开启时不挂载，省去每个连接的探查
+            debug = is_debug_enabled()
+            on_connect = _log_family if debug else None
+            self._owns_session = on_connect is not None
+            if self.use_ipv6 or self.prefer_ipv6:
+                sess = create_ipv6_session(
+                    on_connect=on_connect,
+                    record_last=debug,
+                    workers=self._workers,
+                    prefer_ipv6=not self.use_ipv6,
+                )
+                if self.use_ipv6:
+                    logger.info("使用IPv6专用会话进行网络请求")
+                else:
+                    logger.info("使用IPv6优先（Happy Eyeballs）会话进行网络请求")
             else:
                 sess = create_observing_session(
-                    on_connect=_log_family, record_last=True
+                    on_connect=on_connect, record_last=debug, workers=self._workers
                 )
                 logger.info("使用标准会话进行网络请求")
             return sess
 
         self._session = _LazySession(_factory)
 
+    def close(self) -> None:
+        """关闭本实例独占的客户端；共享客户端由 close_sessions() 统一关闭
+
+        关闭后仍可继续下载，届时会重新创建客户端。
+        """
+        self._session.release(close=self._owns_session)
+
     def _ensure_session(self):
         # 若是懒加载代理，则进行实体化
         if hasattr(self._session, "ensure"):
@@ -98,6 +150,7 @@ class ModelScopeDownloader:
         timeout: int = 60,
         only_raw: bool = False,
         only_no_raw: bool = False,
+        use_async: bool = False,
     ) -> Dict[str, Any]:
         """
         根据计划文件下载所有条目。
@@ -111,10 +164,16 @@ class ModelScopeDownloader:
             timeout: HTTP 请求超时秒数
             only_raw: 仅下载带 raw_url 的文件
             only_no_raw: 仅下载不带 raw_url 的文件
+            use_async: 使用 httpx.AsyncClient 协程并发下载（并发上限为 workers * 4）；
+                不支持 prefer_ipv6（Happy Eyeballs），也不输出逐连接的 DEBUG 日志
 
         Returns:
             下载结果统计信息字典
         """
+        # Happy Eyeballs 仅在同步传输中实现，异步路径无法兑现 prefer_ipv6
+        if use_async and self.prefer_ipv6 and not self.use_ipv6:
+            raise ValueError("参数冲突：--async 不支持 --prefer-ipv6")
+
         # 读取计划
         with open(plan_path, encoding="utf-8") as f:
             plan: Plan = json.load(f)
@@ -166,164 +225,215 @@ class ModelScopeDownloader:
         overall_total = (
             sum(int(f["size"]) for f in files) if overall_mode == "bytes" else total
         )
-        overall_bar = tqdm(
-            total=overall_total,
-            unit="B" if overall_mode == "bytes" else "file",
-            unit_scale=True if overall_mode == "bytes" else False,
-            desc="总进度",
-        )
-        sequential = workers <= 1
+        if overall_mode == "bytes":
+            overall_bar = make_progress(overall_total, desc="总进度")
+        else:
+            overall_bar = tqdm(total=overall_total, unit="file", desc="总进度")
+        sequential = workers <= 1 and not use_async
         lock = Lock()
+        # 会话尚未创建时，按并发数确定连接池大小
+        self._workers = max(workers, 1)
 
-        def _download_one(item: PlanFile) -> Dict[str, Any]:
-            # 确保会话已创建（仅下载阶段构建）
-            self._ensure_session()
-            # 优先使用 raw_url（通常指向支持 IPv6 的 CDN 直链）
-            url = item.get("raw_url") or item["url"]
+        def _advance(n: int) -> None:
+            # 并发模式下多个线程共享总进度条
+            if sequential:
+                overall_bar.update(n)
+            else:
+                with lock:
+                    overall_bar.update(n)
+
+        def _discard(tmp_path: str) -> None:
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except Exception:  # noqa: BLE001
+                pass
+
+        def _prepare(item: PlanFile) -> Optional[Dict[str, Any]]:
+            """创建目标目录；目标已存在且应跳过时返回跳过结果"""
             rel_path = item["path"]  # 相对路径
             target = os.path.join(root_dir, rel_path)
-            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # 多数文件共享少量父目录；目录已存在时 ensure_dir 只需一次 stat
+            ensure_dir(os.path.dirname(target))
 
             # 已存在处理
-            if os.path.exists(target) and not overwrite:
-                if skip_existing:
-                    # 跳过时更新总进度
-                    if overall_mode == "count":
-                        if sequential:
-                            overall_bar.update(1)
-                        else:
-                            with lock:
-                                overall_bar.update(1)
-                    elif overall_mode == "bytes" and isinstance(item.get("size"), int):
-                        size_delta = int(item["size"])  # 仅在已知大小时更新
-                        if sequential:
-                            overall_bar.update(size_delta)
-                        else:
-                            with lock:
-                                overall_bar.update(size_delta)
-                    # 显示当前文件
-                    logger.info("跳过: {} (已存在)", rel_path)
-                    return {"path": rel_path, "status": "skipped"}
+            if os.path.exists(target) and not overwrite and skip_existing:
+                # 跳过时更新总进度
+                if overall_mode == "count":
+                    _advance(1)
+                elif overall_mode == "bytes" and isinstance(item.get("size"), int):
+                    _advance(int(item["size"]))  # 仅在已知大小时更新
+                # 显示当前文件
+                logger.info("跳过: {} (已存在)", rel_path)
+                return {"path": rel_path, "status": "skipped"}
+            return None
+
+        def _on_chunk(
+            chunk: bytes, hasher: Optional[Any], file_bar: Optional[Any]
+        ) -> None:
+            if hasher is not None:
+                hasher.update(chunk)
+            # 更新单文件与总进度
+            if file_bar is not None:
+                file_bar.update(len(chunk))
+            if overall_mode == "bytes":
+                _advance(len(chunk))
+
+        def _finalize(
+            item: PlanFile, tmp_path: str, hasher: Optional[Any], bytes_written: int
+        ) -> Dict[str, Any]:
+            """下载完成后，先进行校验，再移动到目标位置"""
+            rel_path = item["path"]
+            expected_size = item.get("size")
+            expected_sha = item.get("sha256")
+            if expected_size is not None:
+                try:
+                    if int(expected_size) != int(bytes_written):
+                        # 大小不一致，删除临时文件并报错
+                        _discard(tmp_path)
+                        logger.error("大小校验失败: {}", rel_path)
+                        return {"path": rel_path, "status": "size-mismatch"}
+                except Exception:  # noqa: BLE001
+                    pass
+
+            if hasher is not None:
+                got_sha = hasher.hexdigest()
+                if (
+                    isinstance(expected_sha, str)
+                    and got_sha.lower() != expected_sha.lower()
+                ):
+                    _discard(tmp_path)
+                    logger.error("校验失败(sha256): {}", rel_path)
+                    return {"path": rel_path, "status": "hash-mismatch"}
+
+            os.replace(tmp_path, os.path.join(root_dir, rel_path))
+
+            # 若以文件计数作为总进度，完成后+1
+            if overall_mode == "count":
+                _advance(1)
+            # 提示完成
+            logger.success("完成: {}", rel_path)
+            return {"path": rel_path, "status": "ok"}
+
+        def _new_hasher(item: PlanFile) -> Optional[Any]:
+            return hashlib.sha256() if isinstance(item.get("sha256"), str) else None
+
+        def _log_start(item: PlanFile) -> None:
+            # 提示开始下载的文件（并发/顺序均可见）
+            logger.info(
+                "开始下载: {} ({})",
+                item["path"],
+                "raw" if item.get("raw_url") else "origin",
+            )
+
+        def _download_one(item: PlanFile) -> Dict[str, Any]:
+            # 确保会话已创建（仅下载阶段构建）
+            self._ensure_session()
+            skipped_result = _prepare(item)
+            if skipped_result is not None:
+                return skipped_result
 
+            # 优先使用 raw_url（通常指向支持 IPv6 的 CDN 直链）
+            url = item.get("raw_url") or item["url"]
+            rel_path = item["path"]
+            tmp_path = os.path.join(root_dir, rel_path) + ".part"
             # 当前文件进度条（仅顺序下载时展示）
             file_bar = None
-            tmp_path = target + ".part"
             try:
                 if sequential:
                     # 在顺序模式下将总进度条描述改为当前文件
                     overall_bar.set_description(f"总进度 | 正在下载: {rel_path}")
                 if sequential and isinstance(item.get("size"), int):
-                    file_bar = tqdm(
-                        total=int(item["size"]),
-                        unit="B",
-                        unit_scale=True,
-                        desc=f"下载 {rel_path}",
-                        leave=False,
+                    file_bar = make_progress(
+                        int(item["size"]), desc=f"下载 {rel_path}", leave=False
                     )
 
-                # 提示开始下载的文件（并发/顺序均可见）
-                logger.info(
-                    "开始下载: {} ({})",
-                    rel_path,
-                    "raw" if item.get("raw_url") else "origin",
+                _log_start(item)
+                hasher = _new_hasher(item)
+                bytes_written = stream_to_file(
+                    self._session,
+                    url,
+                    tmp_path,
+                    timeout=timeout,
+                    on_chunk=lambda chunk: _on_chunk(chunk, hasher, file_bar),
                 )
 
-                expected_size = item.get("size")
-                expected_sha = item.get("sha256")
-                hasher = hashlib.sha256() if isinstance(expected_sha, str) else None
-                bytes_written = 0
-
-                with self._session.stream("GET", url, timeout=timeout) as r:
-                    r.raise_for_status()
-
-                    # 在请求建立后输出当前连接信息
+                # 输出本次下载使用的连接信息（读取连接时已记录的值）
+                if is_debug_enabled():
                     try:
                         transport = getattr(self._session, "_transport", None)
                         fam = getattr(transport, "last_socket_family", None)
                         peer = getattr(transport, "last_sockaddr", None)
-                        fam_str = {socket.AF_INET: "IPv4", socket.AF_INET6: "IPv6"}.get(
-                            fam, str(fam)
-                        )
                         if fam is None:
                             logger.debug("当前连接: 无记录")
                         else:
-                            logger.debug("当前连接: family={} peer={}", fam_str, peer)
+                            logger.debug(
+                                "当前连接: family={} peer={}",
+                                socket_family_name(fam),
+                                peer,
+                            )
                     except Exception:
                         # 记录失败不影响下载
                         pass
-                    with open(tmp_path, "wb") as wf:
-                        for chunk in r.iter_bytes(chunk_size=1024 * 1024):
-                            if not chunk:
-                                continue
-                            wf.write(chunk)
-                            bytes_written += len(chunk)
-                            if hasher is not None:
-                                hasher.update(chunk)
-                            # 更新单文件与总进度
-                            if file_bar is not None:
-                                file_bar.update(len(chunk))
-                            if overall_mode == "bytes":
-                                if sequential:
-                                    overall_bar.update(len(chunk))
-                                else:
-                                    with lock:
-                                        overall_bar.update(len(chunk))
-
-                # 下载完成后，先进行校验，再移动到目标位置
-                if expected_size is not None:
-                    try:
-                        if int(expected_size) != int(bytes_written):
-                            # 大小不一致，删除临时文件并报错
-                            try:
-                                if os.path.exists(tmp_path):
-                                    os.remove(tmp_path)
-                            except Exception:
-                                pass
-                            logger.error("大小校验失败: {}", rel_path)
-                            return {"path": rel_path, "status": "size-mismatch"}
-                    except Exception:  # noqa: BLE001
-                        pass
 
-                if hasher is not None:
-                    got_sha = hasher.hexdigest()
-                    if (
-                        isinstance(expected_sha, str)
-                        and got_sha.lower() != expected_sha.lower()
-                    ):
-                        try:
-                            if os.path.exists(tmp_path):
-                                os.remove(tmp_path)
-                        except Exception:
-                            pass
-                        logger.error("校验失败(sha256): {}", rel_path)
-                        return {"path": rel_path, "status": "hash-mismatch"}
-
-                os.replace(tmp_path, target)
-
-                # 若以文件计数作为总进度，完成后+1
-                if overall_mode == "count":
-                    if sequential:
-                        overall_bar.update(1)
-                    else:
-                        with lock:
-                            overall_bar.update(1)
-                # 提示完成
-                logger.success("完成: {}", rel_path)
-                return {"path": rel_path, "status": "ok"}
+                return _finalize(item, tmp_path, hasher, bytes_written)
             except Exception as e:  # noqa: BLE001
                 # 清理临时文件
-                try:
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-                except Exception:  # noqa: BLE001
-                    pass
+                _discard(tmp_path)
                 logger.error("失败: {} -> {}", rel_path, e)
                 return {"path": rel_path, "status": "error", "error": str(e)}
             finally:
                 if file_bar is not None:
                     file_bar.close()
 
-        if sequential:
+        async def _download_one_async(
+            client: httpx.AsyncClient, semaphore: asyncio.Semaphore, item: PlanFile
+        ) -> Dict[str, Any]:
+            async with semaphore:
+                skipped_result = _prepare(item)
+                if skipped_result is not None:
+                    return skipped_result
+
+                url = item.get("raw_url") or item["url"]
+                rel_path = item["path"]
+                tmp_path = os.path.join(root_dir, rel_path) + ".part"
+                try:
+                    _log_start(item)
+                    hasher = _new_hasher(item)
+                    bytes_written = await astream_to_file(
+                        client,
+                        url,
+                        tmp_path,
+                        timeout=timeout,
+                        on_chunk=lambda chunk: _on_chunk(chunk, hasher, None),
+                    )
+                    return _finalize(item, tmp_path, hasher, bytes_written)
+                except Exception as e:  # noqa: BLE001
+                    _discard(tmp_path)
+                    logger.error("失败: {} -> {}", rel_path, e)
+                    return {"path": rel_path, "status": "error", "error": str(e)}
+
+        async def _download_all_async() -> List[Dict[str, Any]]:
+            # 单线程事件循环中以协程并发；并发上限高于线程模式
+            concurrency = max(workers, 1) * 4
+            semaphore = asyncio.Semaphore(concurrency)
+            if self.use_ipv6:
+                client = create_ipv6_async_session(workers=concurrency)
+            else:
+                client = create_async_session(workers=concurrency)
+            async with client:
+                return list(
+                    await asyncio.gather(
+                        *(
+                            _download_one_async(client, semaphore, item)
+                            for item in files
+                        )
+                    )
+                )
+
+        if use_async:
+            results = asyncio.run(_download_all_async())
+        elif sequential:
             for item in files:
                 results.append(_download_one(item))
         else:
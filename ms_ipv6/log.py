@@ -0,0 +1,112 @@
+"""
+Logging helpers for the ms_ipv6 package
+
+仅依赖 loguru，不加载网络栈，CLI 在无需下载的路径上可直接导入。
+"""
+
+import sys
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+from loguru import logger
+
+_DEBUG_LEVEL_NO = 10
+
+_LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
+    "<blue>LOG</blue> "
+    "<level>{level.icon}</level> | "
+    "<cyan>{file: >10}:{line: <4}</cyan> | "
+    "<level>{message}</level>"
+)
+
+# 统一各级别 icon，确保可以在控制台显示并具有相同的宽度
+_LEVEL_ICONS = (
+    ("TRACE", "[T]"),
+    ("DEBUG", "[D]"),
+    ("INFO", "[I]"),
+    ("SUCCESS", "[S]"),
+    ("WARNING", "[W]"),
+    ("ERROR", "[E]"),
+    ("CRITICAL", "[C]"),
+)
+
+# setup_logging 最近一次生效的 (verbose, use_tqdm)；None 表示尚未配置
+_LOG_CONFIGURED: Optional[Tuple[bool, bool]] = None
+# 串行化重新配置；配置未变化时的快速返回不加锁
+_log_lock = threading.Lock()
+# level icon 是否已设置（与 sink 配置无关，进程内只需一次；在 _log_lock 下修改）
+_icons_configured = False
+
+
+def setup_logging(verbose: bool = False, *, use_tqdm: bool = False) -> None:
+    """配置 loguru 日志
+
+    Args:
+        verbose: 是否启用详细日志
+        use_tqdm: 是否通过 tqdm.write 输出，避免破坏进度条
+    """
+    # 配置未变化时不重建 sink
+    if _LOG_CONFIGURED == (verbose, use_tqdm):
+        return
+
+    with _log_lock:
+        # 等锁期间可能已由其他线程完成相同配置
+        if _LOG_CONFIGURED != (verbose, use_tqdm):
+            _configure_logging(verbose, use_tqdm)
+
+
+def _configure_logging(verbose: bool, use_tqdm: bool) -> None:
+    """重建 loguru sink；调用方需持有 _log_lock"""
+    global _LOG_CONFIGURED, _icons_configured
+
+    logger.remove()
+    # 输出被重定向（文件、管道、CI）时不写入 ANSI 颜色码
+    colorize = sys.stdout.isatty()
+    level = "DEBUG" if verbose else "INFO"
+
+    sink: Any = sys.stdout
+    if use_tqdm:
+        # 使用 tqdm.write 作为 sink，避免破坏进度条
+        # 导入只在配置时做一次，sink 本身不再查找模块
+        try:
+            from tqdm import tqdm  # 局部导入，避免非下载路径的硬依赖
+        except ImportError:
+            pass
+        else:
+
+            def _tqdm_sink(
+                message: str, _write: Callable[..., None] = tqdm.write
+            ) -> None:
+                # loguru 已带换行，这里不再追加换行
+                _write(message, end="")
+
+            sink = _tqdm_sink
+
+    logger.add(
+        sink,
+        format=_LOG_FORMAT,
+        colorize=colorize,
+        diagnose=False,
+        level=level,
+    )
+
+    # 调整logger level的默认icon（进程内全局生效，仅需设置一次）
+    if not _icons_configured:
+        for name, icon in _LEVEL_ICONS:
+            logger.level(name, icon=icon)
+        _icons_configured = True
+
+    _LOG_CONFIGURED = (verbose, use_tqdm)
+
+
+def is_debug_enabled() -> bool:
+    """判断当前是否有 sink 接收 DEBUG 级别日志
+
+    用于在热路径上跳过仅为调试日志服务的计算（socket 探查、格式化等）。
+
+    Returns:
+        DEBUG 日志是否会被输出
+    """
+    # loguru 未公开该值；min_level 为所有 sink 中最低的级别号（DEBUG=10）
+    return logger._core.min_level <= _DEBUG_LEVEL_NO
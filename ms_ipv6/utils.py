@@ -2,67 +2,54 @@
 Utility functions for the ms_ipv6 package
 """
 
+import asyncio
+import functools
+import importlib.util
+import ipaddress
 import os
 import socket
-import sys
+import threading
+import time
+from itertools import zip_longest
 from pathlib import Path
-from typing import Any, Callable, Optional, Tuple
+from queue import Empty, Queue
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from urllib.parse import unquote, urlparse
 
 import httpcore
 import httpx
 from loguru import logger
 
+from .log import (
+    is_debug_enabled,
+    setup_logging,  # noqa: F401  兼容旧导入路径
+)
 
-def setup_logging(verbose: bool = False, *, use_tqdm: bool = False) -> None:
-    """配置 loguru 日志
+# HTTP/2 需要可选依赖 h2（pip install "ms-ipv6[http2]"）
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
 
-    Args:
-        verbose: 是否启用详细日志
-    """
-    logger.remove()
-    log_format = (
-        "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
-        "<blue>LOG</blue> "
-        "<level>{level.icon}</level> | "
-        "<cyan>{file: >10}:{line: <4}</cyan> | "
-        "<level>{message}</level>"
-    )
-
-    if use_tqdm:
-        # 使用 tqdm.write 作为 sink，避免破坏进度条
-        def _tqdm_sink(message: str) -> None:
-            try:
-                from tqdm import tqdm  # 局部导入，避免非下载路径的硬依赖
-
-                # loguru 已带换行，这里不再追加换行
-                tqdm.write(message, end="")
-            except Exception:
-                sys.stdout.write(message)
-
-        logger.add(
-            _tqdm_sink,
-            format=log_format,
-            colorize=True,
-            diagnose=False,
-            level="DEBUG" if verbose else "INFO",
-        )
-    else:
-        logger.add(
-            sys.stdout,
-            format=log_format,
-            diagnose=False,
-            level="DEBUG" if verbose else "INFO",
-        )
+# getaddrinfo 结果缓存：(host, port, family) -> (解析时间, [(family, sockaddr), ...])
+_ADDRINFO_TTL = 60.0
+_addrinfo_cache: Dict[
+    Tuple[str, int, int], Tuple[float, List[Tuple[int, Tuple[Any, ...]]]]
+] = {}
+# 每个 key 一把锁：同一主机的并发未命中只解析一次，不同主机互不阻塞
+_addrinfo_key_locks: Dict[Tuple[str, int, int], threading.Lock] = {}
+_addrinfo_lock = threading.Lock()
 
-    # 调整logger level的默认icon
-    # 确保可以在控制台显示并具有相同的宽度
-    logger.level("TRACE", icon="[T]")
-    logger.level("DEBUG", icon="[D]")
-    logger.level("INFO", icon="[I]")
-    logger.level("SUCCESS", icon="[S]")
-    logger.level("WARNING", icon="[W]")
-    logger.level("ERROR", icon="[E]")
-    logger.level("CRITICAL", icon="[C]")
+# Happy Eyeballs（RFC 8305）：相邻两次连接尝试之间的间隔
+_HAPPY_EYEBALLS_DELAY = 0.25
+# 最近一次竞速胜出的地址：(host, port) -> sockaddr，后续连接优先尝试
+_happy_eyeballs_winners: Dict[Tuple[str, int], Tuple[Any, ...]] = {}
 
 
 def ensure_dir(path: str) -> Path:
@@ -75,37 +62,213 @@ def ensure_dir(path: str) -> Path:
     Returns:
         Path对象
     """
-    dir_path = Path(path)
-    dir_path.mkdir(parents=True, exist_ok=True)
-    return dir_path
+    # 已存在时只需一次 stat；否则交给 os.makedirs 逐级创建
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+    return Path(path)
+
+
+# 用于探测 IPv6 路由的公网地址（数字形式，不触发 DNS 解析）
+_IPV6_PROBE_ADDRESS = ("2001:4860:4860::8888", 53)
 
 
+@functools.lru_cache(maxsize=1)
 def is_ipv6_available() -> bool:
     """
     检查IPV6是否可用
 
+    结果在进程内缓存：一次 CLI 运行期间 IPv6 可达性不会有实质变化。
+    需要重新探测时（例如测试中）调用 ``is_ipv6_available.cache_clear()``。
+
     Returns:
         IPV6是否可用
     """
+    if not socket.has_ipv6:
+        return False
     try:
-        # 尝试创建IPv6 socket并连接到Google DNS
-        sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-        sock.settimeout(1)
-        sock.connect(("2001:4860:4860::8888", 53))
-        sock.close()
-        return True
+        # 尝试创建IPv6 socket并"连接"到Google DNS
+        # UDP connect 仅在内核中查路由表并绑定对端，不收发数据包，
+        # 因此使用非阻塞 socket 即可，无需等待超时
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.connect(_IPV6_PROBE_ADDRESS)
+            # 内核为该路由选定的源地址：仅有链路本地/回环地址时无法访问公网
+            source = ipaddress.ip_address(sock.getsockname()[0].split("%", 1)[0])
     except Exception:
         return False
+    return not (source.is_link_local or source.is_loopback or source.is_unspecified)
+
+
+def _cached_getaddrinfo(
+    host: str, port: int, family: int = socket.AF_UNSPEC
+) -> List[Tuple[int, Tuple[Any, ...]]]:
+    """带 TTL 的 getaddrinfo 缓存，避免每个新连接都重复 DNS 解析
+
+    Args:
+        host: 主机名或IP
+        port: 端口
+        family: 地址族（AF_UNSPEC/AF_INET/AF_INET6）
+
+    Returns:
+        [(family, sockaddr), ...] 列表，顺序与系统解析结果一致
+    """
+    key = (host, port, family)
+    entry = _addrinfo_cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] < _ADDRINFO_TTL:
+        return entry[1]
+
+    with _addrinfo_lock:
+        key_lock = _addrinfo_key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        # 等锁期间可能已由其他线程完成解析
+        entry = _addrinfo_cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < _ADDRINFO_TTL:
+            return entry[1]
+        infos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+        addrs: List[Tuple[int, Tuple[Any, ...]]] = [
+            (info[0], info[4]) for info in infos
+        ]
+        _addrinfo_cache[key] = (time.monotonic(), addrs)
+        return addrs
+
+
+def _invalidate_addrinfo(host: str, port: int, family: int) -> None:
+    """移除缓存的解析结果（全部地址连接失败时调用）"""
+    _addrinfo_cache.pop((host, port, family), None)
+
+
+def _happy_eyeballs_order(
+    host: str, port: int, addrs: List[Tuple[int, Tuple[Any, ...]]]
+) -> List[Tuple[int, Tuple[Any, ...]]]:
+    """按 RFC 8305 排序：IPv6 优先并与 IPv4 交替，上次胜出的地址排最前"""
+    v6 = [a for a in addrs if a[0] == socket.AF_INET6]
+    others = [a for a in addrs if a[0] != socket.AF_INET6]
+    ordered = [a for pair in zip_longest(v6, others) for a in pair if a is not None]
+    winner = _happy_eyeballs_winners.get((host, port))
+    for index, addr in enumerate(ordered):
+        if addr[1] == winner:
+            ordered.insert(0, ordered.pop(index))
+            break
+    return ordered
+
+
+def _family_for_local_address(local_address: Optional[str]) -> int:
+    """根据绑定的本地地址推断可用的目标地址族"""
+    if not local_address:
+        return socket.AF_UNSPEC
+    return socket.AF_INET6 if ":" in local_address else socket.AF_INET
+
+
+def _sockaddr_host(family: int, sockaddr: Tuple[Any, ...]) -> str:
+    """将 sockaddr 还原为可直接连接的主机字符串（保留 IPv6 scope id）"""
+    if family == socket.AF_INET6 and len(sockaddr) >= 4 and sockaddr[3]:
+        return f"{sockaddr[0]}%{sockaddr[3]}"
+    return str(sockaddr[0])
+
+
+_FAMILY_NAMES: Dict[int, str] = {socket.AF_INET: "IPv4", socket.AF_INET6: "IPv6"}
+
+
+def socket_family_name(family: Optional[int]) -> str:
+    """将地址族转换为可读名称（IPv4/IPv6）"""
+    if family is None:
+        return str(family)
+    return _FAMILY_NAMES.get(family, str(family))
+
+
+class SockAddr(NamedTuple):
+    """已建立连接的对端地址（固定字段，IPv4 的 flowinfo/scopeid 为 0）"""
+
+    family: int
+    host: str
+    port: int
+    flowinfo: int = 0
+    scopeid: int = 0
+
+    @classmethod
+    def from_sockaddr(cls, family: int, sockaddr: Tuple[Any, ...]) -> "SockAddr":
+        """由 getpeername() 返回的元组构建"""
+        return cls(family, *sockaddr)
+
+    def as_tuple(self) -> Tuple[Any, ...]:
+        """还原为 socket 模块使用的地址元组"""
+        if self.family == socket.AF_INET6:
+            return (self.host, self.port, self.flowinfo, self.scopeid)
+        return (self.host, self.port)
+
+    def __str__(self) -> str:
+        if self.family == socket.AF_INET6:
+            return f"[{self.host}]:{self.port}"
+        return f"{self.host}:{self.port}"
+
+
+def _extract_family_peer(
+    stream: httpcore.NetworkStream,
+) -> Optional[Tuple[socket.socket, int, Tuple[Any, ...]]]:
+    """从 NetworkStream 中取出底层 socket、地址族与对端地址
+
+    Returns:
+        (socket, family, peer)；stream 未暴露 socket 时为 None
+    """
+    sock = stream.get_extra_info("socket")
+    if sock is None:
+        return None
+    return sock, sock.family, sock.getpeername()
+
+
+def _verify_ipv6_stream(stream: httpcore.NetworkStream, host: str, port: int) -> None:
+    """确认 IPv6 专用连接确实建立在 AF_INET6 socket 上，否则关闭并报错"""
+    sock = stream.get_extra_info("socket")
+    if sock is not None and sock.family != socket.AF_INET6:
+        stream.close()
+        raise httpcore.ConnectError(
+            f"expected an IPv6 connection to {host}:{port}, got {socket_family_name(sock.family)}"
+        )
 
 
 # Custom transport classes for httpx with connection logging
 # httpx uses httpcore which provides trace extensions for monitoring connections
 
 
+def _build_socket_options() -> List[Tuple[int, int, int]]:
+    """TCP keepalive 选项：尽早发现失效的保活连接（平台不支持的选项自动跳过）"""
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (
+        ("TCP_KEEPIDLE", 30),
+        ("TCP_KEEPINTVL", 10),
+        ("TCP_KEEPCNT", 3),
+    ):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+# httpcore 已为每个连接设置 TCP_NODELAY，这里只补充 keepalive
+_SOCKET_OPTIONS = _build_socket_options()
+
+
+_SYNC_BACKEND = httpcore.SyncBackend()
+
+# 从原连接池继承的配置：(参数名, 缺省值)，对应属性名为 "_" + 参数名
+_POOL_CONFIG_DEFAULTS: Tuple[Tuple[str, Any], ...] = (
+    ("ssl_context", None),
+    ("max_connections", None),
+    ("max_keepalive_connections", None),
+    ("keepalive_expiry", None),
+    ("http1", True),
+    ("http2", False),
+    ("retries", 0),
+    ("local_address", None),
+    ("uds", None),
+    ("socket_options", None),
+)
+
+
 def _replace_pool_with_logging_backend(
     transport: httpx.HTTPTransport,
     on_connect: Optional[Callable[[socket.socket, Tuple[Any, ...]], None]],
     record_last: bool,
+    happy_eyeballs: bool = False,
 ) -> None:
     """替换transport的连接池，使用带日志记录的网络后端
 
@@ -113,38 +276,35 @@ def _replace_pool_with_logging_backend(
         transport: HTTPTransport实例
         on_connect: 连接回调函数
         record_last: 是否记录连接信息
+        happy_eyeballs: 双栈解析时是否使用 Happy Eyeballs 竞速连接
     """
     try:
-        # 创建带日志记录的网络后端
-        default_backend = httpcore.SyncBackend()
+        # 创建带日志记录的网络后端（底层 SyncBackend 无状态，全局共享）
         logging_backend = _ConnectionLoggingNetworkBackend(
-            default_backend,
+            _SYNC_BACKEND,
             on_connect=on_connect,
             record_last=record_last,
             parent_transport=transport,
+            happy_eyeballs=happy_eyeballs,
         )
 
         # 获取现有连接池的配置
         old_pool = transport._pool
 
         # 重新创建连接池，使用我们的logging backend
+        pool_kwargs = {
+            name: getattr(old_pool, "_" + name, default)
+            for name, default in _POOL_CONFIG_DEFAULTS
+        }
         transport._pool = httpcore.ConnectionPool(
-            ssl_context=getattr(old_pool, "_ssl_context", None),
-            max_connections=getattr(old_pool, "_max_connections", None),
-            max_keepalive_connections=getattr(
-                old_pool, "_max_keepalive_connections", None
-            ),
-            keepalive_expiry=getattr(old_pool, "_keepalive_expiry", None),
-            http1=getattr(old_pool, "_http1", True),
-            http2=getattr(old_pool, "_http2", False),
-            retries=getattr(old_pool, "_retries", 0),
-            local_address=getattr(old_pool, "_local_address", None),
-            uds=getattr(old_pool, "_uds", None),
-            network_backend=logging_backend,
-            socket_options=getattr(old_pool, "_socket_options", None),
+            network_backend=logging_backend, **pool_kwargs
         )
     except Exception as e:
-        logger.warning("Failed to replace connection pool with logging backend: %s", e)
+        logger.warning("Failed to replace connection pool with logging backend: {}", e)
+
+
+def _noop(*args: Any, **kwargs: Any) -> None:
+    """未提供 on_connect 时的默认回调"""
 
 
 class _ConnectionLoggingNetworkBackend(httpcore.NetworkBackend):
@@ -156,11 +316,14 @@ class _ConnectionLoggingNetworkBackend(httpcore.NetworkBackend):
         on_connect: Optional[Callable[[socket.socket, Tuple[Any, ...]], None]] = None,
         record_last: bool = False,
         parent_transport: Any = None,
+        happy_eyeballs: bool = False,
     ):
         self._backend = backend
-        self._on_connect = on_connect
+        # 以空回调代替 None，连接路径上无需再判断
+        self._on_connect = on_connect or _noop
         self._record_last = record_last
         self._parent_transport = parent_transport
+        self._happy_eyeballs = happy_eyeballs
 
     def connect_tcp(
         self,
@@ -171,58 +334,193 @@ class _ConnectionLoggingNetworkBackend(httpcore.NetworkBackend):
         socket_options: Optional[list] = None,
     ) -> httpcore.NetworkStream:
         """连接TCP并记录连接信息"""
-        stream = self._backend.connect_tcp(
+        stream = self._connect_resolved(
             host, port, timeout, local_address, socket_options
         )
 
-        # 尝试从stream中获取socket信息
-        # 注意：这依赖于httpcore的内部实现，可能在未来版本中改变
+        # 无回调、无需记录且 DEBUG 关闭时，跳过 socket 探查（含 getpeername 系统调用）
+        if (
+            self._on_connect is _noop
+            and not self._record_last
+            and not is_debug_enabled()
+        ):
+            return stream
+
         try:
-            # httpcore的NetworkStream包装了底层socket
-            # 尝试多种可能的属性名称以提高兼容性
-            sock = None
-            for attr_name in ("_stream", "_sock", "socket"):
-                sock = getattr(stream, attr_name, None)
-                if sock is not None:
-                    break
-
-            if sock is not None:
-                try:
-                    family = getattr(sock, "family", None)
-                    sockaddr = (
-                        sock.getpeername() if hasattr(sock, "getpeername") else None
-                    )
-
-                    # 记录连接信息
-                    if self._record_last and self._parent_transport is not None:
-                        self._parent_transport.last_socket_family = family
-                        self._parent_transport.last_sockaddr = sockaddr
-
-                    # 触发回调
-                    if self._on_connect is not None:
-                        try:
-                            self._on_connect(sock, sockaddr)
-                        except Exception as cb_err:
-                            logger.debug("on_connect callback raised: %r", cb_err)
-
-                    # 记录日志
-                    fam_str = {socket.AF_INET: "IPv4", socket.AF_INET6: "IPv6"}.get(
-                        family, str(family)
-                    )
-                    logger.debug(
-                        "connection established: host={} port={} family={} peer={}",
-                        host,
-                        port,
-                        fam_str,
-                        sockaddr,
-                    )
-                except Exception as e:
-                    logger.debug("Failed to extract socket info: %s", e)
+            info = _extract_family_peer(stream)
         except Exception as e:
-            logger.debug("Failed to log connection: %s", e)
+            logger.debug("Failed to extract socket info: {}", e)
+            return stream
+        if info is None:
+            return stream
+        sock, family, sockaddr = info
+        peer = SockAddr.from_sockaddr(family, sockaddr)
+
+        # 记录连接信息
+        if self._record_last and self._parent_transport is not None:
+            self._parent_transport.last_socket_family = family
+            self._parent_transport.last_sockaddr = peer
+
+        # 触发回调
+        try:
+            self._on_connect(sock, sockaddr)
+        except Exception as cb_err:
+            logger.debug("on_connect callback raised: {!r}", cb_err)
+
+        # 记录日志（DEBUG 关闭时跳过格式化）
+        if is_debug_enabled():
+            logger.debug(
+                "connection established: host={} port={} family={} peer={}",
+                host,
+                port,
+                socket_family_name(family),
+                str(peer),
+            )
+
+        return stream
+
+    def _connect_resolved(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float],
+        local_address: Optional[str],
+        socket_options: Optional[list],
+    ) -> httpcore.NetworkStream:
+        """使用缓存的解析结果连接，直到某个地址连接成功"""
+        family = _family_for_local_address(local_address)
+        try:
+            addrs = _cached_getaddrinfo(host, port, family)
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
 
+        try:
+            if self._happy_eyeballs and family == socket.AF_UNSPEC and len(addrs) > 1:
+                return self._connect_happy_eyeballs(
+                    host, port, addrs, timeout, local_address, socket_options
+                )
+            stream = self._connect_sequential(
+                host, port, addrs, timeout, local_address, socket_options
+            )
+        except (httpcore.ConnectError, httpcore.ConnectTimeout):
+            # 所有地址均失败：丢弃缓存，下次重新解析
+            _invalidate_addrinfo(host, port, family)
+            _happy_eyeballs_winners.pop((host, port), None)
+            raise
+
+        if family == socket.AF_INET6:
+            _verify_ipv6_stream(stream, host, port)
         return stream
 
+    def _connect_sequential(
+        self,
+        host: str,
+        port: int,
+        addrs: List[Tuple[int, Tuple[Any, ...]]],
+        timeout: Optional[float],
+        local_address: Optional[str],
+        socket_options: Optional[list],
+    ) -> httpcore.NetworkStream:
+        """按解析顺序依次尝试各地址"""
+        last_error: Optional[Exception] = None
+        for addr_family, sockaddr in addrs:
+            try:
+                return self._backend.connect_tcp(
+                    _sockaddr_host(addr_family, sockaddr),
+                    port,
+                    timeout,
+                    local_address,
+                    socket_options,
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+
+        if last_error is None:
+            raise httpcore.ConnectError(f"no address found for {host}:{port}")
+        raise last_error
+
+    def _connect_happy_eyeballs(
+        self,
+        host: str,
+        port: int,
+        addrs: List[Tuple[int, Tuple[Any, ...]]],
+        timeout: Optional[float],
+        local_address: Optional[str],
+        socket_options: Optional[list],
+    ) -> httpcore.NetworkStream:
+        """Happy Eyeballs v2：IPv6 优先，每隔 250ms 或上一个尝试失败时启动下一个
+
+        首个连接成功者胜出，其余仍在进行的尝试在完成后自行关闭。
+        """
+        pending_addrs = iter(_happy_eyeballs_order(host, port, addrs))
+        # (sockaddr, 成功的 stream, 失败的异常)
+        results: Queue[
+            Tuple[
+                Tuple[Any, ...], Optional[httpcore.NetworkStream], Optional[Exception]
+            ]
+        ] = Queue()
+        decided = threading.Event()
+        decided_lock = threading.Lock()
+
+        def _attempt(addr_family: int, sockaddr: Tuple[Any, ...]) -> None:
+            try:
+                stream = self._backend.connect_tcp(
+                    _sockaddr_host(addr_family, sockaddr),
+                    port,
+                    timeout,
+                    local_address,
+                    socket_options,
+                )
+            except Exception as e:
+                results.put((sockaddr, None, e))
+                return
+            with decided_lock:
+                lost = decided.is_set()
+                decided.set()
+            if lost:
+                stream.close()
+                return
+            results.put((sockaddr, stream, None))
+
+        def _start_next() -> bool:
+            addr = next(pending_addrs, None)
+            if addr is None:
+                return False
+            threading.Thread(target=_attempt, args=addr, daemon=True).start()
+            return True
+
+        running = 1 if _start_next() else 0
+        exhausted = running == 0
+        last_error: Optional[Exception] = None
+        while running:
+            try:
+                sockaddr, stream, error = results.get(
+                    timeout=None if exhausted else _HAPPY_EYEBALLS_DELAY
+                )
+            except Empty:
+                # 当前尝试未在间隔内完成，启动下一个地址
+                if _start_next():
+                    running += 1
+                else:
+                    exhausted = True
+                continue
+
+            running -= 1
+            if stream is not None:
+                _happy_eyeballs_winners[(host, port)] = sockaddr
+                return stream
+            last_error = error
+            # 某个尝试失败时立即启动下一个地址
+            if not exhausted:
+                if _start_next():
+                    running += 1
+                else:
+                    exhausted = True
+
+        if last_error is None:
+            raise httpcore.ConnectError(f"no address found for {host}:{port}")
+        raise last_error
+
     def connect_unix_socket(
         self,
         path: str,
@@ -258,8 +556,9 @@ class IPv6OnlyHTTPTransport(httpx.HTTPTransport):
         self._on_connect = on_connect
         self._record_last = record_last
         self.last_socket_family: Optional[int] = None
-        self.last_sockaddr: Optional[Tuple[Any, ...]] = None
+        self.last_sockaddr: Optional[SockAddr] = None
 
+        kwargs.setdefault("socket_options", _SOCKET_OPTIONS)
         # httpx 提示使用 IPv6：通过 local_address 参数
         super().__init__(*args, local_address="::", **kwargs)
 
@@ -275,6 +574,7 @@ class ObservingHTTPTransport(httpx.HTTPTransport):
         *args: Any,
         on_connect: Optional[Callable[[socket.socket, Tuple[Any, ...]], None]] = None,
         record_last: bool = False,
+        happy_eyeballs: bool = False,
         **kwargs: Any,
     ) -> None:
         """创建传输对象
@@ -282,68 +582,371 @@ class ObservingHTTPTransport(httpx.HTTPTransport):
         Args:
             on_connect: 连接建立后回调
             record_last: 是否记录连接信息
+            happy_eyeballs: 是否使用 Happy Eyeballs（IPv6 优先，快速回退 IPv4）
         """
         self._on_connect = on_connect
         self._record_last = record_last
         self.last_socket_family: Optional[int] = None
-        self.last_sockaddr: Optional[Tuple[Any, ...]] = None
+        self.last_sockaddr: Optional[SockAddr] = None
 
+        kwargs.setdefault("socket_options", _SOCKET_OPTIONS)
         super().__init__(*args, **kwargs)
 
         # 替换连接池以使用自定义网络后端
-        _replace_pool_with_logging_backend(self, on_connect, record_last)
+        _replace_pool_with_logging_backend(
+            self, on_connect, record_last, happy_eyeballs=happy_eyeballs
+        )
+
+
+# 连接池与超时的默认配置：复用连接以摊薄 TCP/TLS 握手开销
+_KEEPALIVE_EXPIRY = 30.0
+_DEFAULT_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=50,
+    keepalive_expiry=_KEEPALIVE_EXPIRY,
+)
+_DEFAULT_TIMEOUT = httpx.Timeout(connect=5.0, read=60.0, write=60.0, pool=5.0)
+
+# 进程内共享的客户端：同一配置只构建一次，由 close_sessions() 统一关闭
+_sessions: Dict[Tuple[Any, ...], httpx.Client] = {}
+_sessions_lock = threading.Lock()
+
+
+def _transport_kwargs(workers: Optional[int]) -> Dict[str, Any]:
+    """生成传输参数：按并发线程数调整连接池大小、可用时启用 HTTP/2、设置 socket 选项"""
+    if not workers or workers < 1:
+        limits = _DEFAULT_LIMITS
+    else:
+        limits = httpx.Limits(
+            max_connections=workers * 2,
+            max_keepalive_connections=workers,
+            keepalive_expiry=_KEEPALIVE_EXPIRY,
+        )
+    return {
+        "limits": limits,
+        "http2": _HTTP2_AVAILABLE,
+        "socket_options": _SOCKET_OPTIONS,
+    }
+
+
+def _shared_session(
+    key: Tuple[Any, ...], factory: Callable[[], httpx.Client]
+) -> httpx.Client:
+    """返回 key 对应的共享客户端；不存在或已关闭时重新构建"""
+    with _sessions_lock:
+        client = _sessions.get(key)
+        if client is None or client.is_closed:
+            client = factory()
+            _sessions[key] = client
+        return client
+
+
+def close_sessions() -> None:
+    """关闭并清空所有共享客户端（用于进程退出或测试清理）"""
+    with _sessions_lock:
+        clients = list(_sessions.values())
+        _sessions.clear()
+    for client in clients:
+        client.close()
 
 
 def create_observing_session(
     *,
     on_connect: Optional[Callable[[socket.socket, Tuple[Any, ...]], None]] = None,
     record_last: bool = False,
+    workers: Optional[int] = None,
+    happy_eyeballs: bool = False,
 ) -> httpx.Client:
     """创建带连接观察能力的 httpx 客户端
 
-    在verbose模式下会记录连接的family（IPv4/IPv6）和peer地址
+    在verbose模式下会记录连接的family（IPv4/IPv6）和peer地址。
+    相同参数的调用返回同一个共享客户端；提供 on_connect 时返回独立客户端，
+    由调用方负责关闭。
 
     Args:
         on_connect: 连接建立后回调
         record_last: 是否记录最近一次连接信息
+        workers: 并发下载线程数；提供时按其调整连接池大小，使每个线程都能复用连接
+        happy_eyeballs: 是否使用 Happy Eyeballs（IPv6 优先，250ms 内未连通则并行尝试 IPv4）
 
     Returns:
-        httpx.Client对象
+        httpx.Client对象；无需观察连接且 DEBUG 关闭时为普通 httpx.Client
     """
-    transport = ObservingHTTPTransport(on_connect=on_connect, record_last=record_last)
-    client = httpx.Client(transport=transport, follow_redirects=True)
-    return client
+    # 没有任何观察需求：不构建自定义传输与网络后端
+    plain = (
+        on_connect is None
+        and not record_last
+        and not happy_eyeballs
+        and not is_debug_enabled()
+    )
+
+    def _factory() -> httpx.Client:
+        if plain:
+            return httpx.Client(
+                transport=httpx.HTTPTransport(**_transport_kwargs(workers)),
+                follow_redirects=True,
+                timeout=_DEFAULT_TIMEOUT,
+            )
+        transport = ObservingHTTPTransport(
+            on_connect=on_connect,
+            record_last=record_last,
+            happy_eyeballs=happy_eyeballs,
+            **_transport_kwargs(workers),
+        )
+        return httpx.Client(
+            transport=transport, follow_redirects=True, timeout=_DEFAULT_TIMEOUT
+        )
+
+    # 回调通常绑定调用方实例，放入进程级缓存会使客户端与调用方一直无法释放
+    if on_connect is not None:
+        return _factory()
+    key = ("observing", plain, record_last, workers, happy_eyeballs)
+    return _shared_session(key, _factory)
 
 
 def create_ipv6_session(
     *,
     on_connect: Optional[Callable[[socket.socket, Tuple[Any, ...]], None]] = None,
     record_last: bool = False,
+    workers: Optional[int] = None,
+    prefer_ipv6: bool = False,
 ) -> httpx.Client:
     """
     创建IPv6优先的httpx客户端
 
-    在verbose模式下会记录连接的family（IPv4/IPv6）和peer地址
+    在verbose模式下会记录连接的family（IPv4/IPv6）和peer地址。
+    相同参数的调用返回同一个共享客户端；提供 on_connect 时返回独立客户端，
+    由调用方负责关闭。
 
     Args:
         on_connect: 连接建立后回调
         record_last: 是否记录最近一次连接信息
+        workers: 并发下载线程数；提供时按其调整连接池大小，使每个线程都能复用连接
+        prefer_ipv6: 为 True 时不绑定 IPv6 本地地址，改用 Happy Eyeballs 双栈竞速
+            （IPv6 优先，连不通时回退 IPv4）；默认仅允许 IPv6 连接
 
     Returns:
         配置为IPv6优先的httpx.Client对象
     """
-    transport = IPv6OnlyHTTPTransport(on_connect=on_connect, record_last=record_last)
-    client = httpx.Client(transport=transport, follow_redirects=True)
-    return client
+    if prefer_ipv6:
+        return create_observing_session(
+            on_connect=on_connect,
+            record_last=record_last,
+            workers=workers,
+            happy_eyeballs=True,
+        )
+
+    def _factory() -> httpx.Client:
+        transport = IPv6OnlyHTTPTransport(
+            on_connect=on_connect, record_last=record_last, **_transport_kwargs(workers)
+        )
+        return httpx.Client(
+            transport=transport, follow_redirects=True, timeout=_DEFAULT_TIMEOUT
+        )
 
+    if on_connect is not None:
+        return _factory()
+    key = ("ipv6", record_last, workers)
+    return _shared_session(key, _factory)
 
-def get_default_cache_dir() -> str:
+
+def create_async_session(*, workers: Optional[int] = None) -> httpx.AsyncClient:
+    """创建异步 httpx 客户端，用于协程并发下载
+
+    已安装 h2 时启用 HTTP/2，多个请求复用同一连接。
+
+    Args:
+        workers: 并发数；提供时按其调整连接池大小
+
+    Returns:
+        httpx.AsyncClient对象
     """
-    获取默认缓存目录
+    transport = httpx.AsyncHTTPTransport(**_transport_kwargs(workers))
+    return httpx.AsyncClient(
+        transport=transport, follow_redirects=True, timeout=_DEFAULT_TIMEOUT
+    )
+
+
+def create_ipv6_async_session(*, workers: Optional[int] = None) -> httpx.AsyncClient:
+    """创建IPv6专用的异步 httpx 客户端
+
+    Args:
+        workers: 并发数；提供时按其调整连接池大小
 
     Returns:
-        默认缓存目录路径
+        配置为IPv6的httpx.AsyncClient对象
+    """
+    transport = httpx.AsyncHTTPTransport(
+        local_address="::", **_transport_kwargs(workers)
+    )
+    return httpx.AsyncClient(
+        transport=transport, follow_redirects=True, timeout=_DEFAULT_TIMEOUT
+    )
+
+
+# 流式下载的读取块大小：1 MiB，大文件下载时 Python 层循环次数降至千级
+STREAM_CHUNK_SIZE = 1 << 20
+
+
+def stream_to_file(
+    client: httpx.Client,
+    url: str,
+    path: str,
+    *,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    timeout: Any = httpx.USE_CLIENT_DEFAULT,
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+) -> int:
+    """
+    以流式 GET 将响应体写入文件
+
+    Args:
+        client: httpx 客户端
+        url: 下载地址
+        path: 目标文件路径（覆盖写入）
+        chunk_size: 每次读取的字节数
+        timeout: 请求超时；默认沿用客户端配置
+        on_chunk: 每写入一块后回调（用于校验与进度更新）
+
+    Returns:
+        写入的字节数
+
+    Raises:
+        httpx.HTTPStatusError: 响应状态码表示错误时
+    """
+    written = 0
+    with client.stream("GET", url, timeout=timeout) as r:
+        r.raise_for_status()
+        with open(path, "wb") as wf:
+            for chunk in r.iter_bytes(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                wf.write(chunk)
+                written += len(chunk)
+                if on_chunk is not None:
+                    on_chunk(chunk)
+    return written
+
+
+async def astream_to_file(
+    client: httpx.AsyncClient,
+    url: str,
+    path: str,
+    *,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    timeout: Any = httpx.USE_CLIENT_DEFAULT,
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+) -> int:
+    """
+    stream_to_file 的异步版本：以流式 GET 将响应体写入文件
+
+    Args:
+        client: httpx 异步客户端
+        url: 下载地址
+        path: 目标文件路径（覆盖写入）
+        chunk_size: 每次读取的字节数
+        timeout: 请求超时；默认沿用客户端配置
+        on_chunk: 每写入一块后回调（用于校验与进度更新）
+
+    Returns:
+        写入的字节数
+
+    Raises:
+        httpx.HTTPStatusError: 响应状态码表示错误时
+    """
+    written = 0
+    async with client.stream("GET", url, timeout=timeout) as r:
+        r.raise_for_status()
+        with open(path, "wb") as wf:
+            async for chunk in r.aiter_bytes(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                wf.write(chunk)
+                written += len(chunk)
+                if on_chunk is not None:
+                    on_chunk(chunk)
+    return written
+
+
+async def download_many(
+    urls: Iterable[str],
+    dest_dir: str,
+    *,
+    concurrency: int = 16,
+    use_ipv6: bool = False,
+) -> List[str]:
+    """
+    以协程并发下载多个 URL 到同一目录
+
+    文件名取 URL 路径的最后一段；共用一个异步客户端，同时进行的请求数不超过 concurrency。
+    每个文件先写入 ``.part`` 临时文件，完成后再替换到目标位置；任一下载失败时
+    取消其余下载并清理临时文件。
+
+    Args:
+        urls: 下载地址列表
+        dest_dir: 目标目录（不存在时创建）
+        concurrency: 最大并发请求数
+        use_ipv6: 是否仅使用 IPv6 连接
+
+    Returns:
+        与 urls 顺序一致的本地文件路径列表
+
+    Raises:
+        ValueError: URL 路径中无法取得文件名，或多个 URL 的文件名相同时
+        httpx.HTTPError: 任一下载失败时
     """
+    urls = list(urls)
+    targets = []
+    seen: Dict[str, str] = {}
+    for url in urls:
+        name = os.path.basename(unquote(urlparse(url).path))
+        if not name:
+            raise ValueError(f"无法从 URL 确定文件名: {url}")
+        if name in seen:
+            raise ValueError(f"文件名冲突: {seen[name]} 与 {url} 均对应 {name}")
+        seen[name] = url
+        targets.append(os.path.join(dest_dir, name))
+    ensure_dir(dest_dir)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    if use_ipv6:
+        client = create_ipv6_async_session(workers=concurrency)
+    else:
+        client = create_async_session(workers=concurrency)
+
+    async def _download(url: str, path: str) -> str:
+        tmp_path = path + ".part"
+        async with semaphore:
+            try:
+                await astream_to_file(client, url, tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                # 失败或被取消时不留下不完整的文件
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return path
+
+    async with client:
+        tasks = [
+            asyncio.ensure_future(_download(url, path))
+            for url, path in zip(urls, targets)
+        ]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            # 任一失败即取消其余下载，并在关闭客户端前等待它们结束
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+def _get_default_cache_dir_uncached() -> str:
+    """按当前环境计算默认缓存目录（MS_IPV6_CACHE_DIR 优先）"""
+    override = os.environ.get("MS_IPV6_CACHE_DIR")
+    if override:
+        return os.path.expanduser(override)
     if os.name == "nt":  # Windows
         base_dir = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
         return os.path.join(base_dir, "ms_ipv6", "cache")
@@ -352,6 +955,53 @@ def get_default_cache_dir() -> str:
         return os.path.join(base_dir, "ms_ipv6")
 
 
+# 导入时计算一次，避免每次调用都读取环境变量并展开 ~
+_DEFAULT_CACHE_DIR = _get_default_cache_dir_uncached()
+
+
+def get_default_cache_dir() -> str:
+    """
+    获取默认缓存目录
+
+    可通过环境变量 MS_IPV6_CACHE_DIR 覆盖；结果在导入时确定。
+
+    Returns:
+        默认缓存目录路径
+    """
+    return _DEFAULT_CACHE_DIR
+
+
+def make_progress(total: int, **kwargs: Any) -> Any:
+    """
+    创建按字节计数的 tqdm 进度条
+
+    限制刷新频率：至少累计 total 的 0.1% 且间隔 0.25 秒才重绘，
+    避免大文件下载时频繁渲染及与 tqdm 日志 sink 争用锁。
+
+    Args:
+        total: 总字节数
+        **kwargs: 透传给 tqdm 的其他参数（可覆盖上述默认值）
+
+    Returns:
+        tqdm 进度条对象
+    """
+    from tqdm import tqdm  # 局部导入，避免非下载路径的硬依赖
+
+    options: Dict[str, Any] = {
+        "unit": "B",
+        "unit_scale": True,
+        "miniters": max(total // 1000, 1),
+        "mininterval": 0.25,
+        "maxinterval": 1.0,
+        "smoothing": 0,
+    }
+    options.update(kwargs)
+    return tqdm(total=total, **options)
+
+
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
+
 def get_file_size_human(size_bytes: int) -> str:
     """
     将文件大小转换为人类可读格式
@@ -364,10 +1014,6 @@ def get_file_size_human(size_bytes: int) -> str:
     """
     if size_bytes < 1024:
         return f"{size_bytes} B"
-    elif size_bytes < 1024**2:
-        return f"{size_bytes / 1024:.2f} KB"
-    elif size_bytes < 1024**3:
-        return f"{size_bytes / (1024**2):.2f} MB"
-    else:
-        return f"{size_bytes / (1024**3):.2f} GB"
-    return f"{size_bytes} B"
+    # 每 10 个二进制位对应一级单位
+    index = min((size_bytes.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    return f"{size_bytes / (1 << (index * 10)):.2f} {_SIZE_UNITS[index]}"
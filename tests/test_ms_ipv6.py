@@ -2,27 +2,61 @@
 Tests for the ms_ipv6 package
 """
 
+import asyncio
+import functools
+import http.server
+import io
+import json
 import os
 import socket
+import sys
+import threading
+import time
 from urllib.parse import urlparse
 
+import httpcore
+import httpx
 import pytest
 
+from ms_ipv6 import log, utils
+from ms_ipv6.cli import create_parser
 from ms_ipv6.downloader import ModelScopeDownloader
 from ms_ipv6.utils import (
     IPv6OnlyHTTPTransport,
     create_ipv6_session,
     ensure_dir,
     get_default_cache_dir,
+    get_file_size_human,
 )
 
 
+class _QuietHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """本地测试服务器：不输出访问日志"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def isolated_logging(monkeypatch):
+    """隔离全局日志配置：测试结束后恢复配置状态与 loguru 默认 sink"""
+    monkeypatch.setattr(log, "_LOG_CONFIGURED", None)
+    yield
+    log.logger.remove()
+    log.logger.add(sys.stderr)
+
+
+@pytest.fixture(scope="session")
+def downloader():
+    """进程内共享的默认下载器（会话懒加载，不触发网络）"""
+    return ModelScopeDownloader()
+
+
 class TestModelScopeDownloader:
     """测试ModelScopeDownloader类"""
 
-    def test_init(self):
+    def test_init(self, downloader):
         """测试初始化"""
-        downloader = ModelScopeDownloader()
         assert downloader.cache_dir is not None
         assert not downloader.use_ipv6
 
@@ -42,14 +76,84 @@ class TestModelScopeDownloader:
         assert hasattr(downloader, "_session")
         assert downloader._session is not None
 
-    def test_get_model_info(self):
+    def test_async_rejects_prefer_ipv6(self, tmp_path):
+        """测试异步下载不接受 Happy Eyeballs 模式"""
+        downloader = ModelScopeDownloader(prefer_ipv6=True)
+        with pytest.raises(ValueError):
+            downloader.download_from_plan(
+                str(tmp_path / "plan.json"), local_dir=str(tmp_path), use_async=True
+            )
+
+    @pytest.mark.parametrize("verbose", [False, True])
+    def test_reuse_after_sessions_closed(self, tmp_path, isolated_logging, verbose):
+        """测试 close_sessions()/close() 之后同一下载器仍可继续下载"""
+        served = tmp_path / "served"
+        served.mkdir()
+        (served / "f.txt").write_bytes(b"hello")
+        handler = functools.partial(_QuietHTTPRequestHandler, directory=str(served))
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/f.txt"
+            plan = tmp_path / "plan.json"
+            plan.write_text(
+                json.dumps(
+                    {
+                        "files": [
+                            {"path": "f.txt", "url": url, "raw_url": url, "size": 5}
+                        ]
+                    }
+                )
+            )
+            # verbose 时使用独占客户端，否则使用共享客户端
+            log.setup_logging(verbose)
+            downloader = ModelScopeDownloader(cache_dir=str(tmp_path / "cache"))
+            for i, close in enumerate(
+                [utils.close_sessions, downloader.close, utils.close_sessions]
+            ):
+                summary = downloader.download_from_plan(
+                    str(plan), local_dir=str(tmp_path / f"out{i}"), workers=1
+                )
+                assert summary["success"] == 1
+                close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_get_model_info(self, downloader):
         """测试获取模型信息"""
-        downloader = ModelScopeDownloader()
         info = downloader.get_model_info("test_model")
         assert "model_id" in info
         assert info["model_id"] == "test_model"
 
 
+class _ProbeSocket:
+    """IPv6 探测用的假 socket：connect 后返回指定的源地址"""
+
+    def __init__(self, source):
+        self._source = source
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def setblocking(self, flag):
+        pass
+
+    def connect(self, address):
+        pass
+
+    def getsockname(self):
+        return (self._source, 40000, 0, 0)
+
+    def close(self):
+        self.closed = True
+
+
 class TestUtils:
     """测试工具函数"""
 
@@ -59,6 +163,13 @@ class TestUtils:
         assert cache_dir is not None
         assert len(cache_dir) > 0
 
+    def test_default_cache_dir_env_override(self, monkeypatch, tmp_path):
+        """测试 MS_IPV6_CACHE_DIR 覆盖默认缓存目录"""
+        monkeypatch.setenv("MS_IPV6_CACHE_DIR", str(tmp_path / "cache"))
+        assert utils._get_default_cache_dir_uncached() == str(tmp_path / "cache")
+        monkeypatch.delenv("MS_IPV6_CACHE_DIR")
+        assert utils._get_default_cache_dir_uncached() != str(tmp_path / "cache")
+
     def test_ensure_dir(self, tmp_path):
         """测试确保目录存在"""
         test_dir = tmp_path / "test_subdir"
@@ -66,6 +177,352 @@ class TestUtils:
         assert result.exists()
         assert result.is_dir()
 
+        nested = tmp_path / "a" / "b" / "c"
+        assert ensure_dir(str(nested)).is_dir()
+        # 已存在的目录再次调用不报错
+        assert ensure_dir(str(nested)) == nested
+
+    def test_ensure_dir_recreates_removed_dir(self, tmp_path):
+        """测试目录被删除后再次调用会重新创建"""
+        target = tmp_path / "gone"
+        ensure_dir(str(target))
+        target.rmdir()
+        assert ensure_dir(str(target)).is_dir()
+
+    def test_ensure_dir_relative_path_follows_cwd(self, tmp_path, monkeypatch):
+        """测试相对路径按当前工作目录解析"""
+        (tmp_path / "one").mkdir()
+        (tmp_path / "two").mkdir()
+        monkeypatch.chdir(tmp_path / "one")
+        ensure_dir("rel")
+        monkeypatch.chdir(tmp_path / "two")
+        assert ensure_dir("rel").is_dir()
+        assert (tmp_path / "two" / "rel").is_dir()
+
+    def test_is_ipv6_available_is_cached(self, monkeypatch):
+        """测试 IPv6 探测结果被缓存"""
+        probes = []
+        monkeypatch.setattr(utils.socket, "has_ipv6", True)
+        monkeypatch.setattr(
+            utils.socket,
+            "socket",
+            lambda *args: probes.append(args) or _ProbeSocket("2001:db8::1"),
+        )
+        utils.is_ipv6_available.cache_clear()
+        try:
+            assert utils.is_ipv6_available()
+            assert utils.is_ipv6_available()
+            assert len(probes) == 1
+        finally:
+            utils.is_ipv6_available.cache_clear()
+
+    @pytest.mark.parametrize("source", ["fe80::1%eth0", "::1"])
+    def test_is_ipv6_available_rejects_non_global_source(self, monkeypatch, source):
+        """测试仅有链路本地/回环源地址时判定 IPv6 不可用，且 socket 被关闭"""
+        probe = _ProbeSocket(source)
+        monkeypatch.setattr(utils.socket, "has_ipv6", True)
+        monkeypatch.setattr(utils.socket, "socket", lambda *args: probe)
+        utils.is_ipv6_available.cache_clear()
+        try:
+            assert not utils.is_ipv6_available()
+            assert probe.closed
+        finally:
+            utils.is_ipv6_available.cache_clear()
+
+    def test_is_ipv6_available_without_ipv6_support(self, monkeypatch):
+        """测试系统不支持 IPv6 时直接返回 False"""
+        monkeypatch.setattr(utils.socket, "has_ipv6", False)
+        utils.is_ipv6_available.cache_clear()
+        try:
+            assert not utils.is_ipv6_available()
+        finally:
+            utils.is_ipv6_available.cache_clear()
+
+    def test_stream_to_file(self, tmp_path):
+        """测试流式写入文件并逐块回调"""
+        body = b"x" * 2500
+
+        def handler(request):
+            return httpx.Response(200, content=body)
+
+        chunks = []
+        target = tmp_path / "out.bin"
+        with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+            written = utils.stream_to_file(
+                client,
+                "http://example.test/f",
+                str(target),
+                chunk_size=1024,
+                on_chunk=chunks.append,
+            )
+        assert written == len(body)
+        assert target.read_bytes() == body
+        assert [len(c) for c in chunks] == [1024, 1024, 452]
+
+    def test_stream_to_file_raises_on_error_status(self, tmp_path):
+        """测试错误状态码抛出异常且不写入文件"""
+        transport = httpx.MockTransport(lambda request: httpx.Response(404))
+        target = tmp_path / "missing.bin"
+        with httpx.Client(transport=transport) as client:
+            with pytest.raises(httpx.HTTPStatusError):
+                utils.stream_to_file(client, "http://example.test/f", str(target))
+        assert not target.exists()
+
+    def test_astream_to_file(self, tmp_path):
+        """测试异步流式写入文件并逐块回调"""
+        body = b"y" * 2500
+
+        async def _run():
+            transport = httpx.MockTransport(
+                lambda request: httpx.Response(200, content=body)
+            )
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await utils.astream_to_file(
+                    client,
+                    "http://example.test/f",
+                    str(tmp_path / "out.bin"),
+                    chunk_size=1024,
+                    on_chunk=chunks.append,
+                )
+
+        chunks = []
+        assert asyncio.run(_run()) == len(body)
+        assert (tmp_path / "out.bin").read_bytes() == body
+        assert [len(c) for c in chunks] == [1024, 1024, 452]
+
+    def test_download_many(self, tmp_path, monkeypatch):
+        """测试并发下载多个 URL，结果与输入顺序一致"""
+
+        def handler(request):
+            return httpx.Response(200, content=request.url.path.encode())
+
+        monkeypatch.setattr(
+            utils,
+            "create_async_session",
+            lambda workers=None: httpx.AsyncClient(
+                transport=httpx.MockTransport(handler)
+            ),
+        )
+        urls = [f"http://example.test/files/{i}.bin" for i in range(5)]
+        paths = asyncio.run(utils.download_many(urls, str(tmp_path / "out")))
+        assert [os.path.basename(p) for p in paths] == [f"{i}.bin" for i in range(5)]
+        for i, path in enumerate(paths):
+            with open(path, "rb") as f:
+                assert f.read() == f"/files/{i}.bin".encode()
+
+    def test_make_progress_limits_refresh(self):
+        """测试进度条按总量限制刷新频率，且允许覆盖默认参数"""
+        bar = utils.make_progress(10 * 1024 * 1024, file=io.StringIO())
+        try:
+            assert bar.total == 10 * 1024 * 1024
+            assert bar.miniters == 10 * 1024 * 1024 // 1000
+            assert bar.unit == "B"
+        finally:
+            bar.close()
+
+    def test_setup_logging_is_idempotent(self, isolated_logging, monkeypatch):
+        """测试相同参数重复配置日志时不重建 sink"""
+        removed = []
+        real_remove = log.logger.remove
+
+        def _counting_remove(*args):
+            removed.append(args)
+            return real_remove(*args)
+
+        monkeypatch.setattr(log.logger, "remove", _counting_remove)
+        log.setup_logging(False)
+        assert len(removed) == 1
+        log.setup_logging(False)
+        assert len(removed) == 1
+        log.setup_logging(True)
+        assert len(removed) == 2
+
+    def test_sockaddr(self):
+        """测试对端地址的构建、还原与显示"""
+        v6 = utils.SockAddr.from_sockaddr(socket.AF_INET6, ("2001:db8::1", 443, 0, 0))
+        assert v6.host == "2001:db8::1"
+        assert v6.as_tuple() == ("2001:db8::1", 443, 0, 0)
+        assert str(v6) == "[2001:db8::1]:443"
+
+        v4 = utils.SockAddr.from_sockaddr(socket.AF_INET, ("192.0.2.1", 80))
+        assert v4.as_tuple() == ("192.0.2.1", 80)
+        assert str(v4) == "192.0.2.1:80"
+
+    def test_download_many_rejects_duplicate_names(self, tmp_path):
+        """测试多个 URL 对应同一文件名时直接报错，不发起下载"""
+        urls = [
+            "http://example.test/a/config.json",
+            "http://example.test/b/config.json",
+        ]
+        with pytest.raises(ValueError):
+            asyncio.run(utils.download_many(urls, str(tmp_path / "out")))
+        assert not (tmp_path / "out").exists()
+
+    def test_download_many_cancels_on_failure(self, tmp_path, monkeypatch):
+        """测试任一下载失败时取消其余下载，且不留下文件"""
+        started = []
+
+        async def handler(request):
+            started.append(request.url.path)
+            if request.url.path.endswith("bad.bin"):
+                return httpx.Response(404)
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, content=b"data")
+
+        monkeypatch.setattr(
+            utils,
+            "create_async_session",
+            lambda workers=None: httpx.AsyncClient(
+                transport=httpx.MockTransport(handler)
+            ),
+        )
+        out = tmp_path / "out"
+        urls = ["http://example.test/bad.bin"] + [
+            f"http://example.test/{i}.bin" for i in range(3)
+        ]
+
+        async def _run():
+            with pytest.raises(httpx.HTTPStatusError):
+                await utils.download_many(urls, str(out))
+            # 事件循环继续运行时，被取消的下载也不应在后台写入文件
+            await asyncio.sleep(0.4)
+
+        asyncio.run(_run())
+        assert len(started) == 4
+        assert list(out.iterdir()) == []
+
+    def test_get_file_size_human(self):
+        """测试文件大小格式化"""
+        assert get_file_size_human(0) == "0 B"
+        assert get_file_size_human(1023) == "1023 B"
+        assert get_file_size_human(1024) == "1.00 KB"
+        assert get_file_size_human(1536 * 1024) == "1.50 MB"
+        assert get_file_size_human(1024**3) == "1.00 GB"
+        assert get_file_size_human(3 * 1024**4) == "3.00 TB"
+        assert get_file_size_human(2048 * 1024**4) == "2048.00 TB"
+
+    def test_cached_getaddrinfo(self, monkeypatch):
+        """测试 getaddrinfo 结果在 TTL 内被复用"""
+        calls = []
+
+        def fake_getaddrinfo(host, port, family, type_):
+            calls.append((host, port, family))
+            return [(socket.AF_INET6, type_, 6, "", ("::1", port, 0, 0))]
+
+        monkeypatch.setattr(utils.socket, "getaddrinfo", fake_getaddrinfo)
+        monkeypatch.setattr(utils, "_addrinfo_cache", {})
+        first = utils._cached_getaddrinfo("example.test", 443, socket.AF_INET6)
+        second = utils._cached_getaddrinfo("example.test", 443, socket.AF_INET6)
+        assert first == second == [(socket.AF_INET6, ("::1", 443, 0, 0))]
+        assert len(calls) == 1
+
+
+class _BlackholeIPv6Backend(httpcore.NetworkBackend):
+    """IPv6 地址连接超时、IPv4 地址立即成功的测试后端"""
+
+    def __init__(self):
+        self.hosts = []
+
+    def connect_tcp(
+        self, host, port, timeout=None, local_address=None, socket_options=None
+    ):
+        self.hosts.append(host)
+        if ":" in host:
+            time.sleep(1.0)
+            raise httpcore.ConnectTimeout("blackholed")
+        return httpcore.MockStream([])
+
+
+class TestHappyEyeballs:
+    """测试 Happy Eyeballs 连接竞速"""
+
+    ADDRS = [
+        (socket.AF_INET, ("192.0.2.1", 443)),
+        (socket.AF_INET6, ("2001:db8::1", 443, 0, 0)),
+    ]
+
+    def test_falls_back_to_ipv4_quickly(self, monkeypatch):
+        """IPv6 不通时在间隔后并行尝试 IPv4，而不是等待 IPv6 超时"""
+        monkeypatch.setattr(utils, "_cached_getaddrinfo", lambda *a: self.ADDRS)
+        monkeypatch.setattr(utils, "_happy_eyeballs_winners", {})
+        inner = _BlackholeIPv6Backend()
+        backend = utils._ConnectionLoggingNetworkBackend(inner, happy_eyeballs=True)
+
+        start = time.monotonic()
+        stream = backend.connect_tcp("example.test", 443)
+        elapsed = time.monotonic() - start
+
+        assert stream is not None
+        assert inner.hosts == ["2001:db8::1", "192.0.2.1"]
+        assert elapsed < 0.9
+        assert utils._happy_eyeballs_winners[("example.test", 443)] == (
+            "192.0.2.1",
+            443,
+        )
+
+
+class _IPv4SocketStream(httpcore.NetworkStream):
+    """底层为 IPv4 socket 的测试 stream"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.closed = False
+
+    def get_extra_info(self, info):
+        return self.sock if info == "socket" else None
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+class TestIPv6Verification:
+    """测试 IPv6 专用连接的地址族校验"""
+
+    def test_rejects_non_ipv6_socket(self, monkeypatch):
+        """IPv6 专用连接落在 IPv4 socket 上时关闭并报错"""
+        stream = _IPv4SocketStream()
+
+        class _Backend(httpcore.NetworkBackend):
+            def connect_tcp(self, *args, **kwargs):
+                return stream
+
+        monkeypatch.setattr(
+            utils,
+            "_cached_getaddrinfo",
+            lambda *a: [(socket.AF_INET6, ("2001:db8::1", 443, 0, 0))],
+        )
+        backend = utils._ConnectionLoggingNetworkBackend(_Backend())
+        with pytest.raises(httpcore.ConnectError):
+            backend.connect_tcp("example.test", 443, local_address="::")
+        assert stream.closed
+
+
+class TestCLI:
+    """测试命令行解析"""
+
+    def test_parser_builds_only_requested_subcommand(self):
+        """仅构建 argv 中出现的子命令"""
+        argv = ["plan", "model", "user/repo", "--allow-pattern", "*.json"]
+        args = create_parser(argv).parse_args(argv)
+        assert args.command == "plan"
+        assert args.repo_type == "model"
+        assert args.allow_pattern == ["*.json"]
+
+    def test_parser_download_defaults(self):
+        """download 子命令默认参数"""
+        argv = ["download", "plan.json", "--local-dir", "out"]
+        args = create_parser(argv).parse_args(argv)
+        assert args.command == "download"
+        assert args.workers == 4
+        assert not args.ipv6
+
+    def test_parser_help_lists_all_subcommands(self):
+        """未给出子命令时帮助中列出全部子命令"""
+        help_text = create_parser([]).format_help()
+        for name in ("plan", "download", "version"):
+            assert name in help_text
+
 
 class TestSession:
     """测试会话创建"""
@@ -83,6 +540,41 @@ class TestSession:
         transport = session._transport
         assert isinstance(transport, IPv6OnlyHTTPTransport)
 
+    def test_create_ipv6_session_prefer_ipv6(self):
+        """测试 prefer_ipv6 模式使用双栈 Happy Eyeballs 传输而非仅 IPv6 绑定"""
+        session = create_ipv6_session(prefer_ipv6=True)
+        try:
+            transport = session._transport
+            assert not isinstance(transport, IPv6OnlyHTTPTransport)
+            assert transport._pool._network_backend._happy_eyeballs
+        finally:
+            utils.close_sessions()
+
+    def test_sessions_are_shared_until_closed(self):
+        """测试相同参数返回共享客户端，close_sessions 后重新构建"""
+        first = create_ipv6_session(workers=2)
+        assert create_ipv6_session(workers=2) is first
+        assert create_ipv6_session(workers=3) is not first
+        utils.close_sessions()
+        assert first.is_closed
+        assert create_ipv6_session(workers=2) is not first
+        utils.close_sessions()
+
+    def test_sessions_with_callback_are_not_shared(self):
+        """测试带 on_connect 回调的客户端不进入共享缓存"""
+
+        def on_connect(sock, sockaddr):
+            pass
+
+        first = create_ipv6_session(on_connect=on_connect)
+        second = create_ipv6_session(on_connect=on_connect)
+        try:
+            assert first is not second
+            assert first not in utils._sessions.values()
+        finally:
+            first.close()
+            second.close()
+
     def test_ipv6_adapter_creation(self):
         """测试IPv6传输类的创建"""
         transport = IPv6OnlyHTTPTransport()